@@ -3,27 +3,91 @@ ML Prediction Service for Smart Scheduling
 Loads the trained Random Forest model (smart_scheduler.pkl) and provides duration predictions via HTTP API.
 """
 
-import pickle
+import atexit
+import functools
+import logging
 import os
+import queue
+import re
+import threading
+from logging.handlers import QueueHandler, QueueListener
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from datetime import datetime
+import joblib
 import numpy as np
 
+# Route log records through a queue drained by a background thread, so the
+# request path never blocks on synchronous stdio writes under the GIL.
+_log_queue = queue.Queue(-1)
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+_queue_handler = QueueHandler(_log_queue)
+# QueueHandler pre-formats records before enqueueing; keep that side plain so
+# the listener's formatter is the only one applied.
+_queue_handler.setFormatter(logging.Formatter('%(message)s'))
+logging.basicConfig(level=logging.INFO, handlers=[_queue_handler])
+_log_listener = QueueListener(_log_queue, _log_handler)
+_log_listener.start()
+# The listener thread is a daemon; stop it at exit so queued records are
+# drained instead of dropped when the interpreter shuts down.
+atexit.register(_log_listener.stop)
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
 CORS(app)  # Enable CORS for Flutter app
 
+# orjson serializes the small response dicts several times faster than the
+# stdlib json behind Flask's jsonify and returns bytes directly, so Flask
+# skips its own encoding step. Optional - jsonify is the fallback.
+try:
+    import orjson
+
+    def ojsonify(obj, status=200):
+        """jsonify replacement backed by orjson."""
+        return app.response_class(
+            orjson.dumps(obj), status=status, mimetype='application/json')
+except ImportError:
+    def ojsonify(obj, status=200):
+        """jsonify fallback when orjson is not installed."""
+        response = jsonify(obj)
+        response.status_code = status
+        return response
+
 # Load the trained model
 MODEL_PATH = os.path.join(os.path.dirname(__file__), 'smart_scheduler.pkl')
 model = None
 label_encoders = None
 
+# Procedure-to-code map built from the training-time encoders at model load.
+# Python's hash() is randomized per process, so hash-based encoding would map
+# the same procedure to different feature values in different workers.
+PROC_MAP = {}
+UNKNOWN_PROC = -1  # Bucket for procedures the model never saw
+
+# Guard against concurrent workers double-loading the model
+_model_load_lock = threading.Lock()
+
+def build_proc_map(encoders):
+    """Build {procedure: code} from whichever encoder shape was persisted."""
+    encoder = encoders.get('procedureType') if encoders else None
+    if encoder is None:
+        return {}
+    # Either a sklearn LabelEncoder (classes_) or a pandas category Index
+    classes = getattr(encoder, 'classes_', encoder)
+    return {str(c): i for i, c in enumerate(classes)}
+
 def load_model():
     """Load the trained model and label encoders from PKL file."""
-    global model, label_encoders
-    try:
-        with open(MODEL_PATH, 'rb') as f:
-            data = pickle.load(f)
+    global model, label_encoders, PROC_MAP
+    with _model_load_lock:
+        try:
+            # joblib reads both plain pickles and the compressed archives
+            # written by auto_retrain_model; with an uncompressed archive,
+            # mmap_mode='r' maps the model's numpy arrays so multiple
+            # workers share one copy in page cache instead of each
+            # reconstructing the trees on its own heap.
+            data = joblib.load(MODEL_PATH, mmap_mode='r')
             # PKL file might contain model directly or a dict with model and encoders
             if isinstance(data, dict):
                 model = data.get('model')
@@ -31,63 +95,147 @@ def load_model():
             else:
                 model = data
                 label_encoders = {}
-        print(f"Model loaded successfully from {MODEL_PATH}")
-        return True
-    except FileNotFoundError:
-        print(f"Error: Model file not found at {MODEL_PATH}")
+            PROC_MAP = build_proc_map(label_encoders)
+            # Cached predictions belong to the previous model
+            predict_cached.cache_clear()
+            logger.info(f"Model loaded successfully from {MODEL_PATH}")
+            return True
+        except FileNotFoundError:
+            logger.error(f"Error: Model file not found at {MODEL_PATH}")
+            return False
+        except Exception as e:
+            logger.error(f"Error loading model: {e}")
+            return False
+
+# Optional compiled inference path. sklearn's predict on a single row is
+# dominated by Python-level dispatch; onnxruntime runs the trees as native
+# code. Both the converter and the runtime are optional dependencies -
+# without them the service just uses sklearn predict.
+ONNX_MODEL_PATH = os.path.join(os.path.dirname(__file__), 'smart_scheduler.onnx')
+onnx_session = None
+
+def load_onnx_session():
+    """Load (converting first if possible) the ONNX model, if onnxruntime is installed."""
+    global onnx_session
+    onnx_session = None
+    try:
+        import onnxruntime
+    except ImportError:
         return False
+
+    def onnx_is_stale():
+        """True when the pkl has been retrained since the last conversion."""
+        if not os.path.exists(ONNX_MODEL_PATH):
+            return True
+        try:
+            return os.path.getmtime(MODEL_PATH) > os.path.getmtime(ONNX_MODEL_PATH)
+        except OSError:
+            return True
+
+    try:
+        if onnx_is_stale() and model is not None:
+            # Reconvert whenever the pkl is newer than the export, so a
+            # retrained model is never shadowed by a stale .onnx file.
+            try:
+                from skl2onnx import convert_sklearn
+                from skl2onnx.common.data_types import FloatTensorType
+                onnx_model = convert_sklearn(
+                    model, initial_types=[('input', FloatTensorType([None, 4]))])
+                with open(ONNX_MODEL_PATH, 'wb') as f:
+                    f.write(onnx_model.SerializeToString())
+                logger.info(f"Converted model to ONNX at {ONNX_MODEL_PATH}")
+            except ImportError:
+                pass
+
+        if os.path.exists(ONNX_MODEL_PATH):
+            if onnx_is_stale():
+                # Conversion wasn't possible (no skl2onnx); serving the old
+                # export would silently shadow the retrained pkl.
+                logger.warning(
+                    f"Ignoring stale ONNX model at {ONNX_MODEL_PATH}; falling back to sklearn predict")
+                return False
+            onnx_session = onnxruntime.InferenceSession(
+                ONNX_MODEL_PATH, providers=['CPUExecutionProvider'])
+            logger.info(f"ONNX model loaded from {ONNX_MODEL_PATH}")
+            return True
     except Exception as e:
-        print(f"Error loading model: {e}")
-        return False
+        logger.error(f"Error loading ONNX model: {e}")
+        onnx_session = None
+    return False
 
-# Load model on startup
-if not load_model():
-    print("Warning: Model not loaded. Predictions will use fallback values.")
+def predict_durations(features_array):
+    """Predict via the compiled ONNX session when available, else sklearn."""
+    if onnx_session is not None:
+        input_name = onnx_session.get_inputs()[0].name
+        return onnx_session.run(
+            None, {input_name: features_array.astype(np.float32)}
+        )[0].ravel()
+    return model.predict(features_array)
+
+# Fallback categorical encodings used when no trained encoder is available.
+# Built once at import (not per call); keys are lowercase only and
+# encode_feature lowercases the input once, halving the map size.
+_ENCODING_MAPS = {
+    'patient_type': {'adult': 0, 'child': 1},
+    'day_of_week': {
+        'monday': 0, 'tuesday': 1, 'wednesday': 2, 'thursday': 3,
+        'friday': 4, 'saturday': 5, 'sunday': 6
+    },
+    'time_period': {
+        'morning': 0, 'afternoon': 1, 'evening': 2,
+        'am': 0, 'pm': 1
+    }
+}
 
 def encode_feature(value, feature_name, default=0):
     """Encode a categorical feature using label encoder or simple mapping."""
-    if feature_name in label_encoders:
+    if label_encoders and feature_name in label_encoders:
         try:
             return label_encoders[feature_name].transform([value])[0]
         except:
             return default
-    
+
     # Fallback encoding if no encoder available
-    encoding_maps = {
-        'patient_type': {'Adult': 0, 'Child': 1, 'adult': 0, 'child': 1},
-        'day_of_week': {
-            'Monday': 0, 'Tuesday': 1, 'Wednesday': 2, 'Thursday': 3,
-            'Friday': 4, 'Saturday': 5, 'Sunday': 6,
-            'monday': 0, 'tuesday': 1, 'wednesday': 2, 'thursday': 3,
-            'friday': 4, 'saturday': 5, 'sunday': 6
-        },
-        'time_period': {
-            'Morning': 0, 'Afternoon': 1, 'Evening': 2,
-            'morning': 0, 'afternoon': 1, 'evening': 2,
-            'AM': 0, 'PM': 1
-        }
-    }
-    
-    if feature_name in encoding_maps:
-        return encoding_maps[feature_name].get(value, default)
-    
-    return default
+    mapping = _ENCODING_MAPS.get(feature_name)
+    if mapping is None:
+        return default
+    if isinstance(value, str):
+        value = value.lower()
+    return mapping.get(value, default)
+
+# Fallback durations (simple averages) used when the model is unavailable
+FALLBACK_DURATIONS = {
+    'extraction': 25,
+    'cleaning': 35,
+    'filling': 30,
+    'root canal': 60,
+    'crown': 45,
+    'checkup': 20,
+}
+
+def fallback_duration(procedure_type):
+    """Simple lookup-table estimate used when the model cannot be used."""
+    for key, value in FALLBACK_DURATIONS.items():
+        if key in procedure_type:
+            return float(value)
+    return 60.0  # Default
+
+# Matches "2:00 PM", "14:30", "2PM", ... - a single precompiled scan
+# instead of the repeated split/upper string work this ran per request
+_TIME_RE = re.compile(r'\s*(\d{1,2})(?::\d{2})?\s*(AM|PM)?', re.IGNORECASE)
 
 def get_time_period(time_str):
     """Extract time period (Morning/Afternoon/Evening) from time string."""
     try:
         # Parse time string (e.g., "2:00 PM" or "14:30")
-        if 'AM' in time_str.upper() or 'PM' in time_str.upper():
-            time_part = time_str.split()[0]
-            period = time_str.split()[1].upper() if len(time_str.split()) > 1 else 'AM'
-            hour = int(time_part.split(':')[0])
-            if period == 'PM' and hour != 12:
-                hour += 12
-            elif period == 'AM' and hour == 12:
-                hour = 0
-        else:
-            hour = int(time_str.split(':')[0])
-        
+        match = _TIME_RE.match(time_str)
+        hour = int(match.group(1))
+        period = (match.group(2) or '').upper()
+        if period == 'PM' and hour != 12:
+            hour += 12
+        elif period == 'AM' and hour == 12:
+            hour = 0
+
         if 5 <= hour < 12:
             return 'Morning'
         elif 12 <= hour < 17:
@@ -97,10 +245,79 @@ def get_time_period(time_str):
     except:
         return 'Afternoon'  # Default
 
+# Reusable per-thread (1, 4) buffer for single predictions, so /predict
+# doesn't allocate and dtype-infer a fresh array per request
+_feature_buffers = threading.local()
+
+def get_feature_buffer():
+    """Return this thread's reusable single-row feature buffer."""
+    buf = getattr(_feature_buffers, 'buf', None)
+    if buf is None:
+        buf = np.empty((1, 4), dtype=np.float32)
+        _feature_buffers.buf = buf
+    return buf
+
+def derive_schedule_fields(data):
+    """Derive (day_of_week, time_period) from the request payload."""
+    appointment_date = data.get('appointment_date')
+    appointment_time = data.get('appointment_time', '12:00 PM')
+
+    day_of_week = 'Monday'  # Default
+    if appointment_date:
+        try:
+            date_obj = datetime.fromisoformat(appointment_date.replace('Z', '+00:00'))
+            day_of_week = date_obj.strftime('%A')
+        except:
+            pass
+
+    return day_of_week, get_time_period(appointment_time)
+
+def extract_features(data):
+    """
+    Build the model feature vector for one request payload.
+
+    Returns (features, day_of_week, time_period) so callers can echo the
+    derived fields back in the response.
+    """
+    procedure_type = data.get('procedure_type', '').lower()
+    patient_type = data.get('patient_type', 'Adult')
+    day_of_week, time_period = derive_schedule_fields(data)
+
+    # Feature order: procedure type, patient type, day of week, time period
+    # Note: You may need to adjust feature names based on your actual model
+    features = [
+        PROC_MAP.get(procedure_type, UNKNOWN_PROC),
+        encode_feature(patient_type, 'patient_type'),
+        encode_feature(day_of_week, 'day_of_week'),
+        encode_feature(time_period, 'time_period'),
+    ]
+    return features, day_of_week, time_period
+
+@functools.lru_cache(maxsize=1024)
+def predict_cached(procedure_type, patient_type, day_of_week, time_period):
+    """
+    Memoized single prediction keyed on the categorical 4-tuple.
+
+    The feature space is tiny (procedures x 2 patient types x 7 days x 3
+    time periods), so repeat requests skip encoding and model inference
+    entirely. load_model clears this cache when the model changes.
+    """
+    buf = get_feature_buffer()
+    buf[0, 0] = PROC_MAP.get(procedure_type, UNKNOWN_PROC)
+    buf[0, 1] = encode_feature(patient_type, 'patient_type')
+    buf[0, 2] = encode_feature(day_of_week, 'day_of_week')
+    buf[0, 3] = encode_feature(time_period, 'time_period')
+    return float(predict_durations(buf)[0])
+
+# Load model on startup
+if not load_model():
+    logger.warning("Model not loaded. Predictions will use fallback values.")
+load_onnx_session()
+
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint."""
-    return jsonify({
+    return ojsonify({
         'status': 'healthy',
         'model_loaded': model is not None
     })
@@ -132,72 +349,28 @@ def predict():
         required_fields = ['procedure_type', 'patient_type']
         for field in required_fields:
             if field not in data:
-                return jsonify({
+                return ojsonify({
                     'error': f'Missing required field: {field}'
-                }), 400
+                }, status=400)
         
         procedure_type = data.get('procedure_type', '').lower()
         patient_type = data.get('patient_type', 'Adult')
-        appointment_date = data.get('appointment_date')
-        appointment_time = data.get('appointment_time', '12:00 PM')
-        
-        # If model not loaded, return fallback
-        if model is None:
-            # Fallback durations (simple averages)
-            fallback_durations = {
-                'extraction': 25,
-                'cleaning': 35,
-                'filling': 30,
-                'root canal': 60,
-                'crown': 45,
-                'checkup': 20,
-            }
-            
-            duration = 60  # Default
-            for key, value in fallback_durations.items():
-                if key in procedure_type:
-                    duration = value
-                    break
-            
-            return jsonify({
-                'predicted_duration_minutes': float(duration),
+
+        # Short-circuit to the lookup table when the model is missing or the
+        # procedure is out-of-vocabulary - running inference on an unknown
+        # procedure costs a model call for no accuracy gain.
+        if model is None or (PROC_MAP and procedure_type not in PROC_MAP):
+            return ojsonify({
+                'predicted_duration_minutes': fallback_duration(procedure_type),
                 'confidence': 'low',
                 'model_used': False,
                 'fallback': True
             })
-        
-        # Extract features
-        day_of_week = 'Monday'  # Default
-        if appointment_date:
-            try:
-                date_obj = datetime.fromisoformat(appointment_date.replace('Z', '+00:00'))
-                day_of_week = date_obj.strftime('%A')
-            except:
-                pass
-        
-        time_period = get_time_period(appointment_time)
-        
-        # Encode features (adjust based on your model's expected features)
-        # Note: You may need to adjust feature names based on your actual model
-        features = []
-        
-        # Feature 1: Procedure type (encoded)
-        # For now, use a simple hash-based encoding
-        procedure_encoded = hash(procedure_type) % 1000
-        features.append(procedure_encoded)
-        
-        # Feature 2: Patient type
-        features.append(encode_feature(patient_type, 'patient_type'))
-        
-        # Feature 3: Day of week
-        features.append(encode_feature(day_of_week, 'day_of_week'))
-        
-        # Feature 4: Time period
-        features.append(encode_feature(time_period, 'time_period'))
-        
-        # Make prediction
-        features_array = np.array([features])
-        prediction = model.predict(features_array)[0]
+
+        # Derive the categorical key and serve from the memoized predictor;
+        # cache hits skip encoding and model inference entirely
+        day_of_week, time_period = derive_schedule_fields(data)
+        prediction = predict_cached(procedure_type, patient_type, day_of_week, time_period)
         
         # Ensure prediction is positive and reasonable
         predicted_duration = max(10, min(180, float(prediction)))  # Clamp between 10-180 minutes
@@ -205,7 +378,7 @@ def predict():
         # Determine confidence (simplified - you can improve this)
         confidence = 'high' if model is not None else 'low'
         
-        return jsonify({
+        return ojsonify({
             'predicted_duration_minutes': round(predicted_duration, 1),
             'confidence': confidence,
             'model_used': True,
@@ -218,15 +391,89 @@ def predict():
         })
         
     except Exception as e:
-        print(f"Error in prediction: {e}")
-        return jsonify({
+        logger.error(f"Error in prediction: {e}")
+        return ojsonify({
             'error': str(e),
             'predicted_duration_minutes': 60.0,  # Fallback
             'confidence': 'low',
             'model_used': False
-        }), 500
+        }, status=500)
+
+@app.route('/predict_batch', methods=['POST'])
+def predict_batch():
+    """
+    Predict appointment durations for a list of records in one model call.
+
+    Request body: JSON list of objects with the same fields as /predict.
+
+    Response:
+    {
+        "predicted_duration_minutes": [28.5, ...],
+        "model_used": true
+    }
+    """
+    try:
+        records = request.json
+
+        if not isinstance(records, list) or not records:
+            return ojsonify({'error': 'Request body must be a non-empty JSON list'}, status=400)
+
+        for i, record in enumerate(records):
+            for field in ['procedure_type', 'patient_type']:
+                if field not in record:
+                    return ojsonify({
+                        'error': f'Missing required field {field} in record {i}'
+                    }, status=400)
+
+        if model is None:
+            return ojsonify({
+                'predicted_duration_minutes': [
+                    fallback_duration(r.get('procedure_type', '').lower()) for r in records
+                ],
+                'confidence': 'low',
+                'model_used': False,
+                'fallback': True
+            })
+
+        # Same out-of-vocabulary short-circuit as /predict, per record:
+        # unknown procedures get the lookup-table estimate instead of
+        # feeding UNKNOWN_PROC into the model.
+        durations = [None] * len(records)
+        model_rows = []
+        for i, record in enumerate(records):
+            procedure_type = record.get('procedure_type', '').lower()
+            if PROC_MAP and procedure_type not in PROC_MAP:
+                durations[i] = float(fallback_duration(procedure_type))
+            else:
+                model_rows.append(i)
+
+        # One 2-D feature matrix and a single model.predict call amortizes
+        # the per-call Python overhead across the whole batch.
+        if model_rows:
+            features_array = np.asarray(
+                [extract_features(records[i])[0] for i in model_rows],
+                dtype=np.float32
+            )
+            predictions = predict_durations(features_array)
+            for i, p in zip(model_rows, predictions):
+                durations[i] = max(10, min(180, float(p)))
+
+        return ojsonify({
+            'predicted_duration_minutes': [round(d, 1) for d in durations],
+            'confidence': 'high' if len(model_rows) == len(records) else 'low',
+            'model_used': bool(model_rows)
+        })
+
+    except Exception as e:
+        logger.error(f"Error in batch prediction: {e}")
+        return ojsonify({
+            'error': str(e),
+            'model_used': False
+        }, status=500)
 
 if __name__ == '__main__':
-    # Run on all interfaces, port 5000
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # Development entry point only. In production run under a multi-worker
+    # WSGI server so requests can use all cores, e.g.:
+    #   gunicorn --workers 2 --threads 8 --bind 0.0.0.0:5000 ml_prediction_service:app
+    app.run(host='0.0.0.0', port=5000)
 